@@ -3,18 +3,28 @@
 import wx
 import math
 import threading
+import collections
+import array
+import numpy as np
 
 # for app demo feature
 import time
-import random
+try:
+    from numba import njit # optional, compiles the demo random walk
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda function: function
 
 # for real xbee feature
 import xbee
 import serial
+import fcntl
+import termios
 
 # for results plotting
 import cairoplot
 from series import Series
+from multiprocessing.pool import ThreadPool
 
 # set to non-zero to show each incoming xbee frame to stdout
 XVIZ_DEBUG = 0
@@ -27,19 +37,30 @@ ACCELEROMETER_OFFSET = 1650.0
 ACCELEROMETER_DIVIDER = 1.0
 XBEE_PORT = "/dev/ttyUSB0" # you can find this using the dmesg command as root
 XBEE_POLLING_FREQUENCY = 50
+XBEE_SAMPLE_QUEUE_LENGTH = 10000 # samples waiting for the GUI thread, oldest get dropped past this
 XBEE_VREF = 3300
 DISPLAY_TIME_SECONDS = 3
+RECORDER_INITIAL_SAMPLES = 65536 # recorder storage grows by doubling past this many samples
+FAKE_POLL_STEPS = 4096 # random walk steps drawn at once by the demo poller
+XBEE_READ_TIMEOUT = 0.2 # seconds, so that a truncated frame does not block reads forever
+XBEE_IDLE_WAIT = 0.01 # seconds to wait for incoming bytes before checking for quit again
+XBEE_ASYNC_LOW_LATENCY = 0x2000 # from linux/serial.h, makes FTDI adapters flush every 1ms instead of 16ms
 
 # GUI-related globals
 USE_BUFFERED_DC = True
-UPDATE_EVENT = wx.NewId() #some ID number to use when new data has been collected on serial port from Xbee
+REDRAW_PERIOD_MS = 33 # graphs are repainted at most this often, whatever the polling frequency
 START_BUTTON = wx.NewId() #the start button
 STOP_BUTTON = wx.NewId() #the stop button
 QUIT_BUTTON = wx.NewId() #to quit the program
 X_AXIS_COLOR = (16, 225, 53)
 Y_AXIS_COLOR = (0, 174, 253)
 Z_AXIS_COLOR = (255, 128, 0)
+# same colors as 0-1 floats, the way cairoplot wants them
+X_AXIS_COLOR_F = tuple(c / 255.0 for c in X_AXIS_COLOR)
+Y_AXIS_COLOR_F = tuple(c / 255.0 for c in Y_AXIS_COLOR)
+Z_AXIS_COLOR_F = tuple(c / 255.0 for c in Z_AXIS_COLOR)
 LANGUAGE = "en"
+CSV_ROW_FORMAT = "%f\t%f\t%f\t%f\n" # timestamp, x, y, z
 
 
 # some basic integrated internationalization
@@ -80,31 +101,30 @@ lang["fr"] = {"osd_x_label" : "axe X",
               "osd_title" : "Moniteur Xbee pour accelerometre"
               }
 
-class AccelDataEvent(wx.PyEvent):
-    """Event that delivers XYZ Data as received by Xbee"""
-    def __init__(self, data):
-        wx.PyEvent.__init__(self)
-        self.SetEventType(UPDATE_EVENT)
-        self.data = data
-
 class PollThread(threading.Thread):
     """Base class that abstracts polling dynamics"""
     def __init__(self, target_window):
         threading.Thread.__init__(self)
         self._target = target_window
         # capture synchronization with GUI thread
-        self._should_quit = False
+        self._should_quit = threading.Event()
 
     def run(self):
         self.poll_init()
 
-        while not self._should_quit:
+        while not self._should_quit.is_set():
             self.poll_once()
 
         self.poll_cleanup()
         
     def stop(self):
-        self._should_quit = True
+        self._should_quit.set()
+
+    def post_sample(self, x, y, z):
+        """Timestamps a sample and queues it for the target window,
+        which drains the queue from the GUI thread. deque.append
+        is atomic, so no extra locking is needed"""
+        self._target.sample_queue.append((time.time(), x, y, z))
 
     #empty methods to be overridden by subclasses
     def poll_init(self):
@@ -112,7 +132,8 @@ class PollThread(threading.Thread):
         pass
 
     def poll_once(self):
-        """override with capture logic, should be blocking"""
+        """override with capture logic, should be blocking, but
+        not for long so that stop() gets noticed in time"""
         pass
 
     def poll_cleanup(self):
@@ -120,6 +141,23 @@ class PollThread(threading.Thread):
         pass
         
 
+@njit(cache=True)
+def _random_walk(start, steps, _min, _max):
+    """Returns the successive positions reached from start by
+    applying each row of steps, clamped within [_min, _max]"""
+    walk = np.empty_like(steps)
+    position = start.copy()
+    for i in range(steps.shape[0]):
+        for axis in range(steps.shape[1]):
+            v = position[axis] + steps[i, axis]
+            if v < _min:
+                v = _min
+            elif v > _max:
+                v = _max
+            position[axis] = v
+            walk[i, axis] = v
+    return walk
+
 class FakePollThread(PollThread):
     """Thread that emulates polling the Xbee device, to demonstrate python app,
     use it when you want to test the application and have no xbee at handy."""
@@ -127,25 +165,27 @@ class FakePollThread(PollThread):
         PollThread.__init__(self, target_window)
 
     def poll_init(self):
-        self._x = 0.0
-        self._y = 0.0
-        self._z = 0.0
+        self._state = np.zeros(3) # current x, y, z values
+        self._refill_walk()
 
-    def poll_once(self):
+    def _refill_walk(self):
+        """Computes the next block of random walk positions for
+        the three axis, to be consumed one row per sample"""
+        amplitude = (ACCELEROMETER_MAX_XYZ - ACCELEROMETER_MIN_XYZ) / 500.0
+        steps = np.random.randint(-5, 6, size=(FAKE_POLL_STEPS, 3)) * amplitude
+        self._walk = _random_walk(self._state, steps, ACCELEROMETER_MIN_XYZ, ACCELEROMETER_MAX_XYZ)
+        self._i = 0
 
-        def clamp(v, _min, _max):
-            if v < _min:
-                return _min
-            elif v > _max:
-                return _max
-            return v
+    def poll_once(self):
+        (_x, _y, _z) = self._state
+        self.post_sample(_x, _y, _z)
 
-        wx.PostEvent(self._target, AccelDataEvent((self._x, self._y, self._z)))
-        self._x = clamp(self._x + ((random.randint(0, 10) - 5) / 500.0) * (ACCELEROMETER_MAX_XYZ-ACCELEROMETER_MIN_XYZ), ACCELEROMETER_MIN_XYZ, ACCELEROMETER_MAX_XYZ)
-        self._y = clamp(self._y + ((random.randint(0, 10) - 5) / 500.0) * (ACCELEROMETER_MAX_XYZ-ACCELEROMETER_MIN_XYZ), ACCELEROMETER_MIN_XYZ, ACCELEROMETER_MAX_XYZ)
-        self._z = clamp(self._z + ((random.randint(0, 10) - 5) / 500.0) * (ACCELEROMETER_MAX_XYZ-ACCELEROMETER_MIN_XYZ), ACCELEROMETER_MIN_XYZ, ACCELEROMETER_MAX_XYZ)
+        if self._i == len(self._walk):
+            self._refill_walk()
+        self._state = self._walk[self._i]
+        self._i += 1
 
-        time.sleep(0.02)
+        self._should_quit.wait(0.02)
 
     def poll_cleanup(self):
         pass
@@ -168,23 +208,44 @@ class XbeePollThread(PollThread):
         self._z = 0.0
 
     def poll_init(self):
-        self._port = serial.Serial(self._comport, 9600)
+        self._port = serial.Serial(self._comport, 9600, timeout=XBEE_READ_TIMEOUT)
+        self._set_low_latency()
         self._bee = xbee.XBee(self._port)
 
-    def poll_once(self):
+        # ADC to g conversion is linear : accel = adc * scale - bias
+        self._scale = self._divider * self._vref / 1024.0 / self._mVperG
+        self._bias = self._offset / self._mVperG
+
+    def _set_low_latency(self):
+        """Asks the serial driver to hand over incoming bytes as soon
+        as possible, so that each frame does not get delayed by
+        the USB adapter's latency timer"""
+        # struct serial_struct starts with type, line, port, irq, flags
+        serial_struct = array.array('i', [0] * 64)
+        try:
+            fcntl.ioctl(self._port.fd, termios.TIOCGSERIAL, serial_struct, True)
+            serial_struct[4] |= XBEE_ASYNC_LOW_LATENCY
+            fcntl.ioctl(self._port.fd, termios.TIOCSSERIAL, serial_struct)
+        except IOError:
+            pass # not supported by this driver, keep default latency
 
-        def adc_to_accel(adc):
-            return ((self._divider * (adc * self._vref / 1024.0)) - self._offset) / self._mVperG
+    def poll_once(self):
+        # wait_read_frame only returns once a frame arrived, which
+        # never happens after the Xbee went silent : only enter it
+        # when there are bytes to read, so that stop() gets noticed
+        if self._port.inWaiting() == 0:
+            self._should_quit.wait(XBEE_IDLE_WAIT)
+            return
 
         frame = self._bee.wait_read_frame()
         samples = frame["samples"][0] # we only asked for 1 sample per packet
-        _x = adc_to_accel(samples["adc-0"])
-        _y = adc_to_accel(samples["adc-1"])
-        _z = adc_to_accel(samples["adc-2"])
+        _x = samples["adc-0"] * self._scale - self._bias
+        _y = samples["adc-1"] * self._scale - self._bias
+        _z = samples["adc-2"] * self._scale - self._bias
 #        print (_x, _y, _z)
         if XVIZ_DEBUG:
             print frame
-        wx.PostEvent(self._target, AccelDataEvent((_x, _y, _z)))
+        self.post_sample(_x, _y, _z)
 
     def poll_cleanup(self):
         self._port.close()
@@ -196,6 +257,7 @@ class BufferedWindow(wx.Window):
     def __init__(self, *args, **kwargs):
         # make sure the NO_FULL_REPAINT_ON_RESIZE style flag is set.
         kwargs['style'] = kwargs.setdefault('style', wx.NO_FULL_REPAINT_ON_RESIZE) | wx.NO_FULL_REPAINT_ON_RESIZE
+        self._lastSize = None # size of the current offscreen bitmap
         wx.Window.__init__(self, *args, **kwargs)
 
         wx.EVT_PAINT(self, self.OnPaint)
@@ -211,8 +273,12 @@ class BufferedWindow(wx.Window):
 
     def OnSize(self, event):
         # The Buffer init is done here, to make sure the buffer is always
-        # the same size as the Window
-        Size = self.ClientSize
+        # the same size as the Window. Size events also come on shows and
+        # layout passes that do not change anything, keep the buffer then
+        Size = tuple(self.ClientSize)
+        if Size == self._lastSize:
+            return
+        self._lastSize = Size
 
         # Make new offscreen bitmap: this bitmap will always have the
         # current drawing in it, so it can be used to save the image to
@@ -236,6 +302,14 @@ class BufferedWindow(wx.Window):
         self.Refresh()
         self.Update()
 
+def _doubled_bound(bound, value):
+    """Returns bound doubled as many times as needed for value
+    to fit within it, bound and value having the same sign"""
+    mantissa, exponent = math.frexp(value / float(bound))
+    if mantissa == 0.5: # value / bound is an exact power of two
+        exponent -= 1
+    return math.ldexp(bound, exponent)
+
 class graphWindow(BufferedWindow):
     """The window that displays the curve for a set of points,
     and subclasses our integrated version of a double-buffered window.
@@ -246,48 +320,81 @@ class graphWindow(BufferedWindow):
     be on each side of the X axis."""
     def __init__(self, *args, **kwargs):
         # init with some safe defaults, these should be overwritten using methods
-        self.points = []
         self.xrange = (0, 100)
+        self._reset_points()
         self.yrange = (-100, 100)
         self.color = (255, 0, 0)
         self.bgcolor = (35, 35, 35)
+        self._make_drawing_tools()
+        self._dirty = False # set when points were added since last redraw
+        self._bgBuffer = None # background and axis, only redrawn when needed
+        self._bg_dirty = True
 
         BufferedWindow.__init__(self, *args, **kwargs)
 
+    def _reset_points(self):
+        """private method that (re)allocates the circular buffer
+        holding one value per sample of the time range"""
+        _, fullrange = self.xrange
+        self.points = np.empty(fullrange, dtype=np.float32)
+        self._write = 0 # index of the next slot to be written
+        self._count = 0 # number of valid samples in the buffer
+
+    def _ordered_points(self):
+        """private method that returns the buffered values,
+        oldest first"""
+        if self._count < len(self.points):
+            # the buffer has not wrapped around yet
+            return self.points[:self._count]
+        return np.concatenate((self.points[self._write:], self.points[:self._write]))
+
     def _add_point(self, _value):
         """private method that does the adding of the point to the data list
         and computes the new Y range if needed"""
         _, fullrange = self.xrange
-        cutrange = fullrange / 10
-        if len(self.points) >= fullrange:
-            self.points = self.points[fullrange-cutrange:]
-        self.points.append(_value)
+        self.points[self._write] = _value
+        self._write = (self._write + 1) % fullrange
+        self._count = min(self._count + 1, fullrange)
+        self._dirty = True
 
         #update y range
         _min, _max = self.yrange
+        if _min <= _value <= _max:
+            return
 
-        while _value > _max:
-            _max = 2 * _max
-        while _value < _min:
-            _min = 2 * _min # this is assuming that _min is negative at all times. TODO: better auto-range
+        if _value > _max:
+            _max = _doubled_bound(_max, _value)
+        else:
+            _min = _doubled_bound(_min, _value) # this is assuming that _min is negative at all times. TODO: better auto-range
         self.yrange = (_min, _max)
+        self._bg_dirty = True
+
+    def _make_drawing_tools(self):
+        """private method that creates the pens and brushes
+        once per color change, rather than once per Draw"""
+        self._pen = wx.Pen(self.color, 1, wx.SOLID)
+        self._brush = wx.Brush(self.color, wx.SOLID)
+        self._bgbrush = wx.Brush(self.bgcolor, wx.SOLID)
+        self._axisPen = wx.Pen((255,255,255), 1, wx.SOLID)
 
     def add_point(self, value):
         """Adds a value to the current dataset. 
         Y range will be taken care of automatically,
         if the new value is out of bounds.
 
-        Also, this method asks for a redraw of the
-        window from the main GUI thread, because it
-        might be called from the polling thread."""
+        The window is only marked as needing a redraw,
+        the actual repaint is left to the redraw timer
+        of the main frame so that it does not happen
+        once per sample."""
         self._add_point(value)
-        wx.CallAfter(self.UpdateDrawing) # make sure these are called from the GUI thread
 
     def set_color(self, r, g, b):
         """Change the  value of the color used to plot the data.
         
         Pass three 8-bit based values for r, g, b in that order."""
         self.color = (r, g, b)
+        self._make_drawing_tools()
+        self._bg_dirty = True
 
     def set_value_range(self, _min, _max):
         """Defines the initial range for measured values.
@@ -300,6 +407,7 @@ class graphWindow(BufferedWindow):
         sensor, the sensor parameters, and ultimately
         on the value for vref coming through pin 14)"""
         self.yrange = (_min, _max)
+        self._bg_dirty = True
         
     def set_time_range(self, _max):
         """Defines the time range over which the
@@ -307,24 +415,30 @@ class graphWindow(BufferedWindow):
 
         The unit is number of samples"""
         self.xrange = (0, _max)
+        self._reset_points()
+        self._bg_dirty = True
+
+    def OnSize(self, event):
+        if tuple(self.ClientSize) != self._lastSize:
+            self._bg_dirty = True
+        BufferedWindow.OnSize(self, event)
         
-    def Draw(self, dc):
-        """Main drawing routine called by the 
-        DoubleBufferedWindow super-class"""
-        # comput scaling factors
-        _w, _h = self.GetClientSize()
+    def _draw_background(self, _w, _h, xscale, yscale):
+        """private method that renders the viewport background
+        and the axis into their own bitmap, for Draw to copy from"""
         _xmin, _xmax = self.xrange
         _ymin, _ymax = self.yrange
-        xscale = _w / float(_xmax - _xmin)
-        yscale = _h / float(_ymax - _ymin)
+        self._bgBuffer = wx.EmptyBitmap(_w, _h)
+        dc = wx.MemoryDC()
+        dc.SelectObject(self._bgBuffer)
 
         # clear viewport
-        dc.SetBackground(wx.Brush(self.bgcolor, wx.SOLID))
+        dc.SetBackground(self._bgbrush)
         dc.Clear()
         
         # set drawing color for axis
-        dc.SetBrush(wx.Brush(self.color, wx.SOLID))
-        dc.SetPen(wx.Pen((255,255,255), 1, wx.SOLID))
+        dc.SetBrush(self._brush)
+        dc.SetPen(self._axisPen)
 
         # scaling helper functions
         _xscale = lambda x: int((x-_xmin) * xscale)
@@ -336,34 +450,55 @@ class graphWindow(BufferedWindow):
         if _ymin <= 0 and _ymax >= 0:
             dc.DrawLine(0, _yscale(0), _w, _yscale(0))
 
+        dc.SelectObject(wx.NullBitmap)
+
+    def Draw(self, dc):
+        """Main drawing routine called by the 
+        DoubleBufferedWindow super-class"""
+        # comput scaling factors
+        _w, _h = self.GetClientSize()
+        _xmin, _xmax = self.xrange
+        _ymin, _ymax = self.yrange
+        xscale = _w / float(_xmax - _xmin)
+        yscale = _h / float(_ymax - _ymin)
+
+        # clear viewport and draw axis, from cache when nothing changed
+        if self._bg_dirty:
+            self._bg_dirty = False
+            self._draw_background(_w, _h, xscale, yscale)
+        dc.DrawBitmap(self._bgBuffer, 0, 0)
+
         # set drawing color for plot
-        dc.SetBrush(wx.Brush(self.color, wx.SOLID))
-        dc.SetPen(wx.Pen(self.color, 1, wx.SOLID))
+        dc.SetBrush(self._brush)
+        dc.SetPen(self._pen)
 
         def time_range():
             _min, _max = self.xrange
             return _max - _min
 
         #plot lines after scaling according to window size and value ranges
-        if len(self.points) > 0:
-            scaledlines = []
-            for i in range(1,len(self.points)):
-                scaledlines.append((_xscale(i-1), _yscale(self.points[i-1]), _xscale(i), _yscale(self.points[i])))
-            dc.DrawLineList(scaledlines)
-
-def register_event(window, function, event):
-    window.Connect(-1, -1, event, function)
+        if self._count > 0:
+            points = self._ordered_points()
+            # stay in float32 all along, like the points themselves
+            f32 = np.float32
+            xs = ((np.arange(len(points), dtype=f32) - f32(_xmin)) * f32(xscale)).astype(np.int32)
+            ys = (f32(_h) - (points - f32(_ymin)) * f32(yscale)).astype(np.int32)
+            # consecutive segments share their ends, draw them as one polyline
+            if len(points) > 1:
+                dc.DrawLines(zip(xs.tolist(), ys.tolist()))
 
 class xvizFrame(wx.Frame):
     """The main graphical frame of the Xbee application"""
     def __init__(self, parent, id_, title):
         wx.Frame.__init__(self, parent, id_, title)
+        self._lang = lang[LANGUAGE]
 
         panel = wx.Panel(self, -1)
 
         # recording logic
         self.recording = False
-        self.recorder = []
+        self.recorder = np.empty((RECORDER_INITIAL_SAMPLES, 4), dtype=np.float64)
+        self._rec_n = 0 # number of recorded (timestamp, x, y, z) rows
         self.record_start = 0
 
         self.xScreen = graphWindow(parent=panel, id=-1, size=(200,200))
@@ -381,16 +516,21 @@ class xvizFrame(wx.Frame):
         self.zScreen.set_value_range(ACCELEROMETER_MIN_XYZ, ACCELEROMETER_MAX_XYZ)
         self.zScreen.set_time_range(XBEE_POLLING_FREQUENCY * DISPLAY_TIME_SECONDS)
 
-        xlabel = wx.StaticText(panel, -1, lang[LANGUAGE]["osd_x_label"])
-        ylabel = wx.StaticText(panel, -1, lang[LANGUAGE]["osd_y_label"])
-        zlabel = wx.StaticText(panel, -1, lang[LANGUAGE]["osd_z_label"])
+        # bound once, these get called for every sample
+        self._addx = self.xScreen.add_point
+        self._addy = self.yScreen.add_point
+        self._addz = self.zScreen.add_point
+
+        xlabel = wx.StaticText(panel, -1, self._lang["osd_x_label"])
+        ylabel = wx.StaticText(panel, -1, self._lang["osd_y_label"])
+        zlabel = wx.StaticText(panel, -1, self._lang["osd_z_label"])
 
-        self.status_text = wx.StaticText(panel, -1, lang[LANGUAGE]["osd_status_init"])
+        self.status_text = wx.StaticText(panel, -1, self._lang["osd_status_init"])
         self.status = 0
 
-        start = wx.Button(panel, START_BUTTON, lang[LANGUAGE]["osd_button_start"])
-        stop = wx.Button(panel, STOP_BUTTON, lang[LANGUAGE]["osd_button_stop"])
-        quit_ = wx.Button(panel, QUIT_BUTTON, lang[LANGUAGE]["osd_button_quit"])
+        start = wx.Button(panel, START_BUTTON, self._lang["osd_button_start"])
+        stop = wx.Button(panel, STOP_BUTTON, self._lang["osd_button_stop"])
+        quit_ = wx.Button(panel, QUIT_BUTTON, self._lang["osd_button_quit"])
 
         hsz1 = wx.BoxSizer(wx.HORIZONTAL)
         hsz1.Add(self.xScreen, 1, wx.ALL | wx.EXPAND, 5)
@@ -417,8 +557,9 @@ class xvizFrame(wx.Frame):
         sizer.Add(hsz4, 0, wx.EXPAND, 0)
         panel.SetSizerAndFit(sizer)
 
+        # filled by the polling thread, drained by the redraw timer
+        self.sample_queue = collections.deque(maxlen=XBEE_SAMPLE_QUEUE_LENGTH)
         self.poller = None
-        register_event(self, self.onNewData, UPDATE_EVENT)
 
         self.Bind(wx.EVT_BUTTON, self.onStartBtn, id = START_BUTTON)
         self.Bind(wx.EVT_BUTTON, self.onStopBtn, id = STOP_BUTTON)
@@ -426,6 +567,11 @@ class xvizFrame(wx.Frame):
 
         self.Bind(wx.EVT_CLOSE, self.onClose)
 
+        # repaint graphs at a fixed pace rather than on each new sample
+        self._redrawTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onRedrawTimer, self._redrawTimer)
+        self._redrawTimer.Start(REDRAW_PERIOD_MS)
+
         self.panel = panel
         self.Fit()
 
@@ -443,7 +589,7 @@ class xvizFrame(wx.Frame):
         """Handle user input : GUI start button"""
         if not self.recording:
             self.record_start = time.time()
-            self.status_text.SetLabel(lang[LANGUAGE]["osd_status_record"])
+            self.status_text.SetLabel(self._lang["osd_status_record"])
         self.recording = True
 
     def onStopBtn(self, event):
@@ -451,18 +597,19 @@ class xvizFrame(wx.Frame):
         if self.recording:
             self.recording = False
 
-            self.status_text.SetLabel(lang[LANGUAGE]["osd_status_save"])
+            self.status_text.SetLabel(self._lang["osd_status_save"])
             self.save_curves()
 
-            self.status_text.SetLabel(lang[LANGUAGE]["osd_status_plot"])
+            self.status_text.SetLabel(self._lang["osd_status_plot"])
             self.plot_curves()
 
             self.record_start = 0
-            self.recorder = []
+            self._rec_n = 0
 
-            self.status_text.SetLabel(lang[LANGUAGE]["osd_status_live"])
+            self.status_text.SetLabel(self._lang["osd_status_live"])
 
     def onClose(self, event):
+        self._redrawTimer.Stop()
         self.poller.stop()
         self.poller.join()
         self.app.Exit()
@@ -471,21 +618,47 @@ class xvizFrame(wx.Frame):
         """Handle user input : GUI quit button"""
         self.Close()
 
-    def onNewData(self, event):
-        """Handle data input : new values were received by polling thread"""
-        timestamp = time.time()
-        (_x, _y, _z) = event.data
+    def onRedrawTimer(self, event):
+        """Handle redraw timer : take in new values and
+        repaint graphs that received some"""
+        self.drain_samples()
+        for screen in (self.xScreen, self.yScreen, self.zScreen):
+            if screen._dirty:
+                screen._dirty = False
+                screen.UpdateDrawing()
+
+    def drain_samples(self):
+        """Handle data input : consume the values queued by polling thread"""
+        queue = self.sample_queue
+        if not queue:
+            return
 
         if not self.status: # on first value packet, change "initializing" text
             self.status = 1
-            self.status_text.SetLabel(lang[LANGUAGE]["osd_status_live"])
-
-        if self.recording: # record values, if user so chose
-            self.recorder.append((timestamp, _x, _y, _z))
-
-        self.xScreen.add_point(_x)
-        self.yScreen.add_point(_y)
-        self.zScreen.add_point(_z)
+            self.status_text.SetLabel(self._lang["osd_status_live"])
+
+        popleft = queue.popleft
+        record = self.record
+        recording, record_start = self.recording, self.record_start
+        addx, addy, addz = self._addx, self._addy, self._addz
+        for _ in range(len(queue)):
+            (timestamp, _x, _y, _z) = popleft()
+            # record values, if user so chose. The queue may hold
+            # samples polled before the start button was pressed
+            if recording and timestamp >= record_start:
+                record(timestamp, _x, _y, _z)
+
+            addx(_x)
+            addy(_y)
+            addz(_z)
+
+    def record(self, timestamp, x, y, z):
+        """Helper method to store one sample in the recorder,
+        growing its storage when it is full"""
+        if self._rec_n == len(self.recorder):
+            self.recorder = np.resize(self.recorder, (2 * len(self.recorder), 4))
+        self.recorder[self._rec_n] = (timestamp, x, y, z)
+        self._rec_n += 1
 
     def save_curves(self):
         """Helper method to export recorded data in CSV form
@@ -493,11 +666,14 @@ class xvizFrame(wx.Frame):
         start_time = self.record_start
         st = time.localtime(start_time)
         filename = "accelerometer-log-%d_%02d_%02d-%02d_%02d_%02d.csv" % (st.tm_year, st.tm_mon, st.tm_mday, st.tm_hour, st.tm_min, st.tm_sec)
-        output = open(filename, "wb")
-        output.write(lang[LANGUAGE]["csv_header"])
-        for (t, x, y, z) in self.recorder:
-            output.write("%f\t%f\t%f\t%f\n" % (t-start_time, x, y, z))
-        output.close()
+        rec = self.recorder[:self._rec_n].copy()
+        rec[:, 0] -= start_time
+        # format all rows with a single % operation and write them at once,
+        # np.savetxt would still format and write them one by one
+        rows = CSV_ROW_FORMAT * len(rec) % tuple(rec.ravel().tolist())
+        with open(filename, "w") as output:
+            output.write(self._lang["csv_header"])
+            output.write(rows)
 
     def _plot_data(self, graphique):
         """Helper method to do the graphic rendering and write it to disk"""
@@ -507,13 +683,14 @@ class xvizFrame(wx.Frame):
     def plot_data_single(self, basename, series_name, format_, data, color):
         """Helper method to save a single axis' data to a graphic file"""
         surface = "%s-%s.%s" % (basename, series_name, format_)
-        data[0].name = lang[LANGUAGE]["png_label"] % series_name
+        data[0].name = self._lang["png_label"] % series_name
         graphique = cairoplot.DotLinePlot(surface, data,
                                           640, 480,
                                           "white light_gray", 15,
                                           axis = True,
-                                          x_title = lang[LANGUAGE]["png_x_label"],
-                                          y_title = lang[LANGUAGE]["png_y_label"],
+                                          dots = 0, # lines only, dots overlap anyway
+                                          x_title = self._lang["png_x_label"],
+                                          y_title = self._lang["png_y_label"],
                                           y_bounds = (ACCELEROMETER_MIN_XYZ,
                                                       ACCELEROMETER_MAX_XYZ),
                                           series_legend = True,
@@ -523,15 +700,16 @@ class xvizFrame(wx.Frame):
     def plot_data_all(self, basename, format_, data, color):
         """Helper method to save all axis' data to a graphic file"""
         surface = "%s.%s" % (basename, format_)
-        data[0].name = lang[LANGUAGE]["png_label"] % "X"
-        data[1].name = lang[LANGUAGE]["png_label"] % "Y"
-        data[2].name = lang[LANGUAGE]["png_label"] % "Z"
+        data[0].name = self._lang["png_label"] % "X"
+        data[1].name = self._lang["png_label"] % "Y"
+        data[2].name = self._lang["png_label"] % "Z"
         graphique = cairoplot.DotLinePlot(surface, data,
                                           640, 480,
                                           "white light_gray", 15,
                                           axis = True,
-                                          x_title = lang[LANGUAGE]["png_x_label"],
-                                          y_title = lang[LANGUAGE]["png_y_label"],
+                                          dots = 0, # lines only, dots overlap anyway
+                                          x_title = self._lang["png_x_label"],
+                                          y_title = self._lang["png_y_label"],
                                           y_bounds = (ACCELEROMETER_MIN_XYZ,
                                                       ACCELEROMETER_MAX_XYZ),
                                           series_legend = True,
@@ -541,32 +719,33 @@ class xvizFrame(wx.Frame):
     def plot_curves(self):
         """Helper method to save the overall curve as well as per-axis curve"""
         start_time = self.record_start
-        end_time, _, _, _ = self.recorder[-1]
+        rec = self.recorder[:self._rec_n]
+        end_time = rec[-1, 0]
         st = time.localtime(start_time)
         basename = "accelerometer-plot-%d_%02d_%02d-%02d_%02d_%02d" % (st.tm_year, st.tm_mon, st.tm_mday, st.tm_hour, st.tm_min, st.tm_sec)
 
 
-        datax = []
-        datay = []
-        dataz = []
-        for (t, x, y, z) in self.recorder:
-            deltat = t - start_time
-            datax.append((deltat,x))
-            datay.append((deltat,y))
-            dataz.append((deltat,z))
-        data = Series([datax, datay, dataz])
-
-        def _map_color(col):
-            return map(lambda c: c / 255.0, col)
-
-        x_color = _map_color(X_AXIS_COLOR)
-        y_color = _map_color(Y_AXIS_COLOR)
-        z_color = _map_color(Z_AXIS_COLOR)
-
-        self.plot_data_all(basename, "png", data, [x_color, y_color, z_color])
-        self.plot_data_single(basename, "X", "png", Series([datax]), [x_color])
-        self.plot_data_single(basename, "Y", "png", Series([datay]), [y_color])
-        self.plot_data_single(basename, "Z", "png", Series([dataz]), [z_color])
+        deltat = (rec[:, 0] - start_time).tolist()
+        datax = zip(deltat, rec[:, 1].tolist())
+        datay = zip(deltat, rec[:, 2].tolist())
+        dataz = zip(deltat, rec[:, 3].tolist())
+
+        x_color = X_AXIS_COLOR_F
+        y_color = Y_AXIS_COLOR_F
+        z_color = Z_AXIS_COLOR_F
+
+        # the four pictures are independent, render them side by side.
+        # Each job gets its own Series since plotting renames its items
+        jobs = [(self.plot_data_all, basename, "png", Series([datax, datay, dataz]), [x_color, y_color, z_color]),
+                (self.plot_data_single, basename, "X", "png", Series([datax]), [x_color]),
+                (self.plot_data_single, basename, "Y", "png", Series([datay]), [y_color]),
+                (self.plot_data_single, basename, "Z", "png", Series([dataz]), [z_color])]
+        pool = ThreadPool(len(jobs))
+        try:
+            pool.map(lambda job: job[0](*job[1:]), jobs)
+        finally:
+            pool.close()
+            pool.join()
         
 class xvizApp(wx.App):
     """The application class that does nothing but creating a wxFrame